@@ -25,19 +25,19 @@ import pprint
 from enum import Enum
 from typing import Any, Dict, List, Optional, Sequence, TypeVar
 
+import orjson
 from opentelemetry.exporter.kafka.node_endpoint import NodeEndpoint
 from opentelemetry.sdk.trace import Event
 from opentelemetry.trace import (
     Span,
-    SpanContext,
     StatusCode,
-    format_span_id,
-    format_trace_id,
 )
 
 EncodedLocalEndpointT = TypeVar("EncodedLocalEndpointT")
 
 DEFAULT_MAX_TAG_VALUE_LENGTH = 128
+# Span timestamps are exported as milliseconds
+_NSEC_PER_MSEC = 10 ** 6
 NAME_KEY = "otel.library.name"
 VERSION_KEY = "otel.library.version"
 
@@ -76,8 +76,8 @@ class Encoder(abc.ABC):
 
     @abc.abstractmethod
     def serialize(
-        self, spans: Sequence[Span], local_endpoint: NodeEndpoint
-    ) -> str:
+        self, span: Span, local_endpoint: NodeEndpoint
+    ) -> bytes:
         pass
 
     @abc.abstractmethod
@@ -112,20 +112,12 @@ class Encoder(abc.ABC):
     def _encode_trace_id(trace_id: int) -> Any:
         pass
 
-    @staticmethod
-    def _get_parent_id(span_context) -> Optional[int]:
-        if isinstance(span_context, Span):
-            parent_id = span_context.parent.span_id
-        elif isinstance(span_context, SpanContext):
-            parent_id = span_context.span_id
-        else:
-            parent_id = None
-        return parent_id
-
     def _extract_tags_from_dict(
-        self, tags_dict: Optional[Dict]
+        self, tags_dict: Optional[Dict], tags: Optional[Dict] = None
     ) -> Dict[str, str]:
-        tags = {}
+        """Add the serializable items of tags_dict to tags, a new dict if None"""
+        if tags is None:
+            tags = {}
         if not tags_dict:
             return tags
         for attribute_key, attribute_value in tags_dict.items():
@@ -193,21 +185,23 @@ class Encoder(abc.ABC):
 
         return json.dumps(tag_value_elements, separators=(",", ":"))
 
-    def _extract_tags_from_span(self, span: Span) -> Dict[str, str]:
-        tags = self._extract_tags_from_dict(span.attributes)
+    def _extract_all_tags(self, span: Span) -> Dict[str, str]:
+        """Resource, instrumentation, status and span attribute tags.
+
+        Everything is collected into a single dict in one pass over each
+        source. Span attributes are added last so they take precedence.
+        """
+        tags = {}
         if span.resource:
-            tags.update(self._extract_tags_from_dict(span.resource.attributes))
+            self._extract_tags_from_dict(span.resource.attributes, tags)
         if span.instrumentation_info is not None:
-            tags.update(
-                {
-                    NAME_KEY: span.instrumentation_info.name,
-                    VERSION_KEY: span.instrumentation_info.version,
-                }
-            )
+            tags[NAME_KEY] = span.instrumentation_info.name
+            tags[VERSION_KEY] = span.instrumentation_info.version
         if span.status.status_code is not StatusCode.UNSET:
-            tags.update({"otel.status_code": span.status.status_code.name})
+            tags["otel.status_code"] = span.status.status_code.name
             if span.status.status_code is StatusCode.ERROR:
-                tags.update({"error": span.status.description or ""})
+                tags["error"] = span.status.description or ""
+        self._extract_tags_from_dict(span.attributes, tags)
 
         # if span.dropped_attributes:
         #     tags.update(
@@ -252,12 +246,11 @@ class Encoder(abc.ABC):
 
     @staticmethod
     def _nsec_to_usec_round(nsec: int) -> int:
-        """Round nanoseconds to microseconds
+        """Convert nanoseconds to the exported timestamp unit
 
-        Timestamp in kafka spans is int of microseconds.
-        See: https://kafka.io/pages/instrumenting.html
+        Despite the name, timestamps in kafka spans are int of milliseconds.
         """
-        return (nsec + 500) // 10 ** 6
+        return (nsec + 500) // _NSEC_PER_MSEC
 
 
 class JsonEncoder(Encoder):
@@ -267,27 +260,55 @@ class JsonEncoder(Encoder):
 
     def serialize(
         self, span: Span, local_endpoint: NodeEndpoint
-    ) -> Sequence[str]:
-        encoded_local_endpoint = self._encode_local_endpoint(local_endpoint)
+    ) -> bytes:
+        encoded_local_endpoint = self._encode_static_fields(local_endpoint)
+        return orjson.dumps(
+            self._encode_trace_data(span, encoded_local_endpoint),
+            option=orjson.OPT_NON_STR_KEYS,
+        )
+
+    def encode_batch(
+        self, spans: Sequence[Span], local_endpoint: NodeEndpoint
+    ) -> bytes:
+        """Serialize spans as newline delimited JSON, one span per line."""
+        return b"\n".join(self.encode_spans(spans, local_endpoint))
+
+    def encode_spans(
+        self, spans: Sequence[Span], local_endpoint: NodeEndpoint
+    ) -> List[bytes]:
+        """Serialize each span to its own JSON document."""
+        encoded_local_endpoint = self._encode_static_fields(local_endpoint)
+        return [
+            orjson.dumps(
+                self._encode_trace_data(span, encoded_local_endpoint),
+                option=orjson.OPT_NON_STR_KEYS,
+            )
+            for span in spans
+        ]
+
+    def _encode_trace_data(
+        self, span: Span, encoded_local_endpoint: Dict
+    ) -> Dict:
         # import pdb; pdb.set_trace()
         encoded_span = self._encode_span(span, encoded_local_endpoint)
         trace_data = {
             "source": environ.get('EVENT_SOURCE', 'com.cisco.devx.at'),
             "event": 'trace',
             "startTime": encoded_span['start_time'],
-            "endTime": encoded_span.get('end_time', None),
             "dataKey": '{}.{}'.format(
                 encoded_span['trace_id'],  # str(uuid.uuid4()),
                 encoded_span['span_id']),
             "data": encoded_span
         }
-        # encoded_spans = []
-        # for span in spans:
-        #     encoded_spans.append(
-        #         self._encode_span(span, encoded_local_endpoint)
-        #     )
-        logger.debug('\n{}'.format(pprint.pformat(trace_data)))
-        return json.dumps(trace_data)
+        if 'end_time' in encoded_span:
+            trace_data["endTime"] = encoded_span['end_time']
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('\n{}'.format(pprint.pformat(trace_data)))
+        return trace_data
+
+    def _encode_static_fields(self, local_endpoint: NodeEndpoint) -> Dict:
+        """Fields shared by every span, merged into each encoded span."""
+        return self._encode_local_endpoint(local_endpoint)
 
     @staticmethod
     def _encode_local_endpoint(local_endpoint: NodeEndpoint) -> Dict:
@@ -305,8 +326,10 @@ class JsonEncoder(Encoder):
 
     @staticmethod
     def _encode_span_id(span_id: int) -> str:
-        return format_span_id(span_id)
+        # Same output as format_span_id, without the generic formatter
+        return span_id.to_bytes(8, "big").hex()
 
     @staticmethod
     def _encode_trace_id(trace_id: int) -> str:
-        return format_trace_id(trace_id)
+        # Same output as format_trace_id, without the generic formatter
+        return trace_id.to_bytes(16, "big").hex()
@@ -22,8 +22,12 @@ Usage
 -----
 
 The **OpenTelemetry Kafka JSON Exporter** allows exporting of `OpenTelemetry`_
-traces to `Kafka`_. This exporter sends traces to the configured Kafka
-collector endpoint using JSON over HTTP and supports multiple versions (v1, ).
+traces to `Kafka`_. This exporter produces traces encoded as JSON to the
+configured Kafka topic and supports multiple versions (v1, ).
+
+Exported batches are sent as Kafka messages containing newline delimited JSON
+(NDJSON): consumers must split the message value on ``\\n`` and parse every
+line as a separate trace record.
 
 .. _Kafka: https://kafka.io/
 .. _OpenTelemetry: https://github.com/open-telemetry/opentelemetry-python/
@@ -32,18 +36,19 @@ collector endpoint using JSON over HTTP and supports multiple versions (v1, ).
 .. code:: python
 
     from opentelemetry import trace
-    from opentelemetry.exporter.kafka.json import ZipkinExporter
+    from opentelemetry.exporter.kafka.json import KafkaExporter
     from opentelemetry.sdk.trace import TracerProvider
     from opentelemetry.sdk.trace.export import BatchSpanProcessor
 
     trace.set_tracer_provider(TracerProvider())
     tracer = trace.get_tracer(__name__)
 
-    # create a ZipkinExporter
-    zipkin_exporter = ZipkinExporter(
+    # create a KafkaExporter
+    kafka_exporter = KafkaExporter(
         # version=Protocol.V1
         # optional:
-        # endpoint="http://localhost:9411/api/v2/spans",
+        # kafkatopic="traces",
+        # kafkanodes=["localhost:9092"],
         # local_node_ipv4="192.168.0.1",
         # local_node_ipv6="2001:db8::c001",
         # local_node_port=31313,
@@ -52,7 +57,7 @@ collector endpoint using JSON over HTTP and supports multiple versions (v1, ).
     )
 
     # Create a BatchSpanProcessor and add the exporter to it
-    span_processor = BatchSpanProcessor(zipkin_exporter)
+    span_processor = BatchSpanProcessor(kafka_exporter)
 
     # add to the tracer
     trace.get_tracer_provider().add_span_processor(span_processor)
@@ -62,16 +67,21 @@ collector endpoint using JSON over HTTP and supports multiple versions (v1, ).
 
 The exporter supports the following environment variable for configuration:
 
-- :envvar:`OTEL_EXPORTER_ZIPKIN_ENDPOINT`
-- :envvar:`OTEL_EXPORTER_ZIPKIN_TIMEOUT`
+- :envvar:`OTEL_EXPORTER_KAFKA_TOPIC`
+- :envvar:`OTEL_EXPORTER_KAFKA_NODES`
 
 API
 ---
 """
 
 import logging
+import os
+import queue
+import threading
+import time
+import weakref
 from os import environ
-from typing import Optional, Sequence
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
 import socket
 from opentelemetry.exporter.kafka.encoder import (
     DEFAULT_MAX_TAG_VALUE_LENGTH,
@@ -80,41 +90,225 @@ from opentelemetry.exporter.kafka.encoder import (
 from opentelemetry.exporter.kafka.json.v1 import JsonV1Encoder
 from opentelemetry.exporter.kafka.node_endpoint import IpInput, NodeEndpoint
 from opentelemetry.sdk.resources import SERVICE_NAME
+from opentelemetry.sdk.trace import ReadableSpan
 from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
 from opentelemetry.sdk.trace.export import SimpleSpanProcessor
-from opentelemetry.trace import (
-    Span,
-    format_trace_id,
-)
+from opentelemetry.trace import Span
 from opentelemetry.context import Context, attach, detach, set_value
 from opentelemetry.instrumentation.utils import _SUPPRESS_INSTRUMENTATION_KEY
 
-from confluent_kafka import Producer
+from confluent_kafka import KafkaException, Producer
 
-DEFAULT_ENDPOINT = "http://localhost:9411/api/v2/spans"
 DEFAULT_KAFKATOPIC = "unknown_topic"
 DEFAULT_KAFKANODES = "localhost:9092"
-REQUESTS_SUCCESS_STATUS_CODES = (200, 202)
+DEFAULT_TIMEOUT = 10  # seconds
+# librdkafka's message.max.bytes default, it is enforced locally by produce()
+DEFAULT_MESSAGE_MAX_BYTES = 1000000
+# Room left for the message key and librdkafka's per-message framing
+MESSAGE_OVERHEAD_BYTES = 1024
+# librdkafka settings that let many spans coalesce into a single, compressed
+# broker request. Any of these can be overridden with `producer_config`.
+# Aliases (e.g. queue.buffering.max.ms for linger.ms) must not be listed here,
+# librdkafka applies them in order and the later one would win.
+DEFAULT_PRODUCER_CONFIG = {
+    'linger.ms': 100,
+    'batch.size': 65536,
+    'batch.num.messages': 10000,
+    'compression.type': 'lz4',
+    'acks': '1',
+    'socket.keepalive.enable': True,
+}
 
 OTEL_EXPORTER_KAFKA_TOPIC="OTEL_EXPORTER_KAFKA_TOPIC"
 OTEL_EXPORTER_KAFKA_NODES="OTEL_EXPORTER_KAFKA_NODES"
 
 logger = logging.getLogger(__name__)
 
+
+# Addresses of this host, only set once a lookup succeeds so that a failed
+# (e.g. not yet configured) resolver is retried by the next exporter
+_LOCAL_IPV4 = None
+_LOCAL_IPV6 = None
+
+
+def _local_ipv4() -> Optional[str]:
+    """Resolve the IPv4 address of this host once per process."""
+    global _LOCAL_IPV4  # pylint: disable=global-statement
+    if _LOCAL_IPV4 is None:
+        try:
+            _LOCAL_IPV4 = socket.gethostbyname(socket.gethostname())
+        except OSError:
+            return None
+    return _LOCAL_IPV4
+
+
+def _local_ipv6() -> Optional[str]:
+    """Resolve the IPv6 address of this host once per process."""
+    global _LOCAL_IPV6  # pylint: disable=global-statement
+    if _LOCAL_IPV6 is None:
+        try:
+            _LOCAL_IPV6 = socket.getaddrinfo(
+                socket.gethostname(), 0, socket.AF_INET6
+            )[0][4][0]
+        except OSError:
+            return None
+    return _LOCAL_IPV6
+
+
 class StartEndSpanExporter(SimpleSpanProcessor):
+    """Span processor that exports spans both when they start and when they end.
+
+    Spans are queued and exported in batches by a background thread, so the
+    traced thread never waits on Kafka. Spans are dropped, with a warning,
+    when the queue is full.
+
+    Args:
+        span_exporter: The exporter spans are handed to.
+        max_queue_size: Maximum number of spans waiting to be exported.
+        max_export_batch_size: Maximum number of spans per export() call.
+        schedule_delay_millis: Maximum time a span waits before being exported.
+    """
+
+    def __init__(
+        self,
+        span_exporter: SpanExporter,
+        max_queue_size: int = 2048,
+        max_export_batch_size: int = 512,
+        schedule_delay_millis: float = 100,
+    ):
+        super().__init__(span_exporter)
+        self._max_queue_size = max_queue_size
+        self._max_export_batch_size = max_export_batch_size
+        self._schedule_delay = schedule_delay_millis / 1e3
+        self._dropped_spans = 0
+        self._done = threading.Event()
+        self._start_worker()
+        if hasattr(os, "register_at_fork"):
+            weak_reinit = weakref.WeakMethod(self._at_fork_reinit)
+
+            def after_in_child():
+                reinit = weak_reinit()
+                if reinit is not None:
+                    reinit()
+
+            os.register_at_fork(after_in_child=after_in_child)
+
+    def _start_worker(self) -> None:
+        self._queue = queue.Queue(maxsize=self._max_queue_size)
+        self._worker = threading.Thread(
+            name="StartEndSpanExporter", target=self._worker_loop, daemon=True
+        )
+        self._worker.start()
+
+    def _at_fork_reinit(self) -> None:
+        """Restart the worker in a forked child, only the forking thread
+        survives fork(). Spans queued in the parent are left to the parent.
+        """
+        if self._done.is_set():
+            return
+        self._dropped_spans = 0
+        self._start_worker()
+
     def on_start(
         self, span: Span, parent_context: Optional[Context] = None
     ) -> None:
         if not span.context.trace_flags.sampled:
             return
+        # The span is exported later, on the worker thread. Snapshot it here:
+        # _readable_span() shares the live attributes and events containers.
+        snapshot = span._readable_span()
+        snapshot._attributes = dict(span.attributes)
+        snapshot._events = tuple(span.events)
+        self._enqueue(snapshot)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if not span.context.trace_flags.sampled:
+            return
+        self._enqueue(span)
+
+    def _enqueue(self, span: ReadableSpan) -> None:
+        if self._done.is_set():
+            logger.warning("Already shutdown, dropping span.")
+            return
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self._dropped_spans += 1
+            if self._dropped_spans == 1:
+                logger.warning("Queue is full, likely spans will be dropped.")
+
+    def _worker_loop(self) -> None:
         token = attach(set_value(_SUPPRESS_INSTRUMENTATION_KEY, True))
         try:
-            self.span_exporter.export((span,))
-        # pylint: disable=broad-except
-        except Exception:
-            logger.exception("Exception while exporting Span Start.")
-        detach(token)
+            while not (self._done.is_set() and self._queue.empty()):
+                batch, taken = self._next_batch()
+                try:
+                    if batch:
+                        self.span_exporter.export(batch)
+                # pylint: disable=broad-except
+                except Exception:
+                    logger.exception("Exception while exporting Span batch.")
+                finally:
+                    for _ in range(taken):
+                        self._queue.task_done()
+        finally:
+            detach(token)
+
+    def _next_batch(self) -> Tuple[List[ReadableSpan], int]:
+        """Collect spans until the batch is full or the first one has waited
+        schedule_delay. A wake-up (None) from force_flush or shutdown stops
+        the wait. Returns the batch and the number of queue items taken.
+        """
+        batch = []
+        taken = 0
+        hurry = False
+        item = self._queue.get()
+        deadline = time.monotonic() + self._schedule_delay
+        while True:
+            taken += 1
+            if item is None:
+                hurry = True
+            else:
+                batch.append(item)
+                if len(batch) >= self._max_export_batch_size:
+                    break
+            remaining = deadline - time.monotonic()
+            try:
+                if hurry or self._done.is_set() or remaining <= 0:
+                    item = self._queue.get_nowait()
+                else:
+                    item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+        return batch, taken
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        if self._done.is_set():
+            # Nothing left to flush, and no worker to process a wake-up
+            return True
+        deadline = time.monotonic() + timeout_millis / 1e3
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            # A full queue does not wait for schedule_delay anyway
+            pass
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
 
+    def shutdown(self) -> None:
+        if self._done.is_set():
+            return
+        self._done.set()
+        self._queue.put(None)
+        self._worker.join()
+        if self._dropped_spans:
+            logger.warning("Dropped %d spans, queue was full.", self._dropped_spans)
+        super().shutdown()
 
 
 class KafkaExporter(SpanExporter):
@@ -123,18 +317,17 @@ class KafkaExporter(SpanExporter):
         kafkatopic: Optional[str] = None,
         kafkanodes: Sequence[str] = None,
         version: Protocol = Protocol.V1,
-        endpoint: Optional[str] = None,
         local_node_ipv4: IpInput = None,
         local_node_ipv6: IpInput = None,
         local_node_port: Optional[int] = None,
         max_tag_value_length: Optional[int] = None,
         timeout: Optional[int] = None,
+        producer_config: Optional[Dict] = None,
     ):
         """Kafka exporter.
 
         Args:
             version: The protocol version to be used.
-            endpoint: The endpoint of the Kafka collector.
             local_node_ipv4: Primary IPv4 address associated with this connection.
             local_node_ipv6: Primary IPv6 address associated with this connection.
             local_node_port: Depending on context, this could be a listen port or the
@@ -142,18 +335,26 @@ class KafkaExporter(SpanExporter):
             max_tag_value_length: Max length string attribute values can have.
             timeout: Maximum time the Kafka exporter will wait for each batch export.
                 The default value is 10s.
+            producer_config: librdkafka configuration overriding the
+                DEFAULT_PRODUCER_CONFIG batching and compression settings.
 
             The tuple (local_node_ipv4, local_node_ipv6, local_node_port) is used to represent
             the network context of a node in the service graph.
+
+            Each export() call produces as few Kafka messages as fit the batch
+            within 'message.max.bytes', each holding newline delimited JSON, one
+            trace record per line. Messages are keyed by the trace id of their
+            first span as 16 raw big-endian bytes.
+
+            Spans are encoded inside export(). Pair the exporter with
+            StartEndSpanExporter or BatchSpanProcessor, which call export() from
+            a background thread, so that encoding does not run on the traced
+            thread.
         """
         if not local_node_ipv4:
-            local_node_ipv4 = socket.gethostbyname(socket.gethostname())
+            local_node_ipv4 = _local_ipv4()
         if not local_node_ipv6:
-            try:
-                local_node_ipv6 = socket.getaddrinfo(socket.gethostname(), 0, socket.AF_INET6)
-                local_node_ipv6 = local_node_ipv6[0][4][0]
-            except socket.gaierror:
-                pass
+            local_node_ipv6 = _local_ipv6()
         self.local_node = NodeEndpoint(
             local_node_ipv4, local_node_ipv6, local_node_port
         )
@@ -172,7 +373,49 @@ class KafkaExporter(SpanExporter):
         if version == Protocol.V1:
             self.encoder = JsonV1Encoder(max_tag_value_length)
         self._closed = False
-        self.timeout = timeout
+        self.timeout = DEFAULT_TIMEOUT if timeout is None else timeout
+
+        self._failed = 0
+        self._producer = None
+        if self.kafkanodes and self.kafkatopic:
+            config = {'bootstrap.servers': ','.join(self.kafkanodes)}
+            config.update(DEFAULT_PRODUCER_CONFIG)
+            if producer_config:
+                config.update(producer_config)
+            self._producer = Producer(config)
+            self._max_message_bytes = int(
+                config.get('message.max.bytes', DEFAULT_MESSAGE_MAX_BYTES)
+            ) - MESSAGE_OVERHEAD_BYTES
+
+    def _on_delivery(self, err, msg) -> None:
+        # Invoked by librdkafka from poll()/flush() with the delivery report
+        if err is not None:
+            self._failed += 1
+            logger.error("Traces cannot be uploaded; delivery failed: %s", err)
+
+    def _flush(self) -> int:
+        """Wait for queued messages to be delivered, returns the number left."""
+        return self._producer.flush(self.timeout)
+
+    def _messages(self, spans: Sequence[Span]) -> Iterator[Tuple[bytes, bytes]]:
+        """Group the encoded spans into NDJSON messages below the size limit.
+
+        Yields (key, value) pairs, keyed by the trace id of each message's first
+        span. A span that is too large on its own still gets its own message.
+        """
+        encoded = self.encoder.encode_spans(spans, self.local_node)
+        start, size = 0, -1
+        for index, data in enumerate(encoded):
+            if index > start and size + 1 + len(data) > self._max_message_bytes:
+                yield self._key(spans[start]), b"\n".join(encoded[start:index])
+                start, size = index, -1
+            size += 1 + len(data)
+        if encoded:
+            yield self._key(spans[start]), b"\n".join(encoded[start:])
+
+    @staticmethod
+    def _key(span: Span) -> bytes:
+        return span.get_span_context().trace_id.to_bytes(16, "big")
 
     def export(self, spans: Sequence[Span]) -> SpanExportResult:
         # After the call to Shutdown subsequent calls to Export are
@@ -190,27 +433,44 @@ class KafkaExporter(SpanExporter):
             service_name = spans[0].resource.attributes.get(SERVICE_NAME)
             if service_name:
                 self.local_node.service_name = service_name
-        rv = None
-        for span in spans:
-            context = span.get_span_context()
-            data=self.encoder.serialize(span, self.local_node)
-            if not (self.kafkanodes and self.kafkatopic):
-                # telemetry kafka config not initialized
-                logger.debug("Telemetry: {}".format(data))
-                logger.debug(f"Not sending telemetry. kafka_topic={self.kafkatopic} OR kafka_nodes={self.kafka_nodes} not defined. \nTelemetry")
-                return
-            logger.debug("Sending telemetry to {} on {}\n{}".format(self.kafkatopic, self.kafkanodes, data))
-            producer = Producer({'bootstrap.servers': ','.join(self.kafkanodes)})
-            rv = rv or producer.produce(self.kafkatopic, key=format_trace_id(context.trace_id), value=data)
-            producer.flush(timeout=self.timeout)
-
-        if rv is not None:
-            logger.error("Traces cannot be uploaded; status code: %s", rv)
+        if self._producer is None:
+            # telemetry kafka config not initialized
+            logger.debug(f"Not sending telemetry. kafka_topic={self.kafkatopic} OR kafka_nodes={self.kafkanodes} not defined.")
+            return SpanExportResult.SUCCESS
+
+        if not spans:
+            return SpanExportResult.SUCCESS
+
+        result = SpanExportResult.SUCCESS
+        failed = self._failed
+        for key, data in self._messages(spans):
+            logger.debug("Sending telemetry to %s on %s\n%s", self.kafkatopic, self.kafkanodes, data)
+            try:
+                self._producer.produce(
+                    self.kafkatopic,
+                    key=key,
+                    value=data,
+                    on_delivery=self._on_delivery,
+                )
+            except (BufferError, KafkaException) as exc:
+                # Keep going, the other messages of the batch may still fit
+                logger.error("Traces cannot be uploaded; produce failed: %s", exc)
+                result = SpanExportResult.FAILURE
+            self._producer.poll(0)
+
+        remaining = self._flush()
+        if remaining:
+            logger.error("Traces cannot be uploaded; %s messages not delivered", remaining)
+            return SpanExportResult.FAILURE
+        if self._failed > failed:
             return SpanExportResult.FAILURE
-        return SpanExportResult.SUCCESS
+        return result
 
     def shutdown(self) -> None:
         if self._closed:
             logger.warning("Exporter already shutdown, ignoring call")
             return
         self._closed = True
+        if self._producer is not None:
+            self._flush()
+            self._producer = None
@@ -18,8 +18,15 @@ from os import environ
 from typing import Dict
 import getpass
 
-from opentelemetry.exporter.kafka.encoder import JsonEncoder
-from opentelemetry.trace import Span, SpanKind, TracerProvider
+from opentelemetry.exporter.kafka.encoder import (
+    DEFAULT_MAX_TAG_VALUE_LENGTH,
+    JsonEncoder,
+    _NSEC_PER_MSEC,
+)
+from opentelemetry.exporter.kafka.node_endpoint import NodeEndpoint
+from opentelemetry.trace import Span, SpanKind
+
+__all__ = ["JsonV1Encoder"]
 
 
 class JsonV1Encoder(JsonEncoder):
@@ -28,14 +35,46 @@ class JsonV1Encoder(JsonEncoder):
     API spec: https://github.com/openkafka/kafka-api/blob/master/kafka2-api.yaml
     """
 
-    SPAN_KIND_MAP = {
-        SpanKind.INTERNAL: None,
-        SpanKind.SERVER: "SERVER",
-        SpanKind.CLIENT: "CLIENT",
-        SpanKind.PRODUCER: "PRODUCER",
-        SpanKind.CONSUMER: "CONSUMER",
+    _KIND_STR = {
+        SpanKind.SERVER: "SpanKind.SERVER",
+        SpanKind.CLIENT: "SpanKind.CLIENT",
+        SpanKind.PRODUCER: "SpanKind.PRODUCER",
+        SpanKind.CONSUMER: "SpanKind.CONSUMER",
     }
 
+    def __init__(
+        self, max_tag_value_length: int = DEFAULT_MAX_TAG_VALUE_LENGTH
+    ):
+        super().__init__(max_tag_value_length)
+        # Process wide values, looked up once rather than for every span
+        try:
+            self._enduser_id = getpass.getuser()
+        except (KeyError, OSError):
+            # No login environment variable and no passwd entry for the uid
+            self._enduser_id = environ.get('USER', 'unknown')
+        self._site = environ.get('SITE', 'unknown')
+        self._deployment_env = environ.get('INSTALLTYPE', 'staging')
+        self._static_fields = (None, None)
+
+    def _encode_static_fields(self, local_endpoint: NodeEndpoint) -> Dict:
+        # The exporter updates service_name on its endpoint, so the cached
+        # fields are rebuilt whenever the endpoint's encoded values change.
+        key = (
+            local_endpoint.service_name,
+            local_endpoint.service_namespace,
+            local_endpoint.ipv4,
+        )
+        cached_key, static_fields = self._static_fields
+        if cached_key != key:
+            static_fields = {
+                'location.site': self._site,
+                'enduser.id': self._enduser_id,
+                'deployment.environment': self._deployment_env,
+                **self._encode_local_endpoint(local_endpoint),
+            }
+            self._static_fields = (key, static_fields)
+        return static_fields
+
     def _encode_span(self, span: Span, encoded_local_endpoint: Dict) -> Dict:
         context = span.get_span_context()
         # import pdb; pdb.set_trace()
@@ -58,54 +97,50 @@ class JsonV1Encoder(JsonEncoder):
         # "peer.service.method": f"{tested_service_method}",
         # 'enduser.id': os.environ.get('USER', 'ngdevx'),
         # 'location.site': os.environ.get('SITE', 'unknown')
+        tags = self._extract_all_tags(span)
+        # Same conversion as _nsec_to_usec_round (to milliseconds), inlined as
+        # it runs several times for every span
+        start_time = (span.start_time + 500) // _NSEC_PER_MSEC
         encoded_span = {
             "name": span.name,
             # "traceId": self._encode_trace_id(context.trace_id),
             # "id": self._encode_span_id(context.span_id),
             'trace_id': self._encode_trace_id(context.trace_id),
             'span_id': self._encode_span_id(context.span_id),
-            'trace_state': dict(context.trace_state._dict),
-            'parent_id': self._encode_span_id(span.parent.span_id) if span.parent else None, 
+            # Never mutated by the encoder, so no need for a copy
+            'trace_state': context.trace_state._dict,
             'status.status_code': span.status.status_code.name,
             'status.status_value': span.status.status_code.value,
-            'location.site': environ.get('SITE', 'unknown'),
-            "timestamp": self._nsec_to_usec_round(span.start_time),
-            "start_time": self._nsec_to_usec_round(span.start_time),
-            'enduser.id': getpass.getuser(),
-            'deployment.environment': environ.get('INSTALLTYPE', 'staging'),
-            # "end_time": self._nsec_to_usec_round(span.end_time),
-            # "duration": self._nsec_to_usec_round(
-            #     span.end_time - span.start_time
-            # ),
+            "timestamp": start_time,
+            "start_time": start_time,
             # "localEndpoint": encoded_local_endpoint,
-            "kind": 'SpanKind.{}'.format(self.SPAN_KIND_MAP[span.kind]),
+            **encoded_local_endpoint,
+            **tags,
         }
-        encoded_span.update(encoded_local_endpoint)
 
-        if span.end_time:
-            encoded_span["end_time"] = self._nsec_to_usec_round(span.end_time)
-            encoded_span["duration"] = self._nsec_to_usec_round(
-                span.end_time - span.start_time
-            )
+        # Absent fields are omitted rather than sent as null. Most spans have
+        # no parent and no events, keep those checks to a plain truth test.
+        parent = span.parent
+        if parent is not None:
+            encoded_span["parent_id"] = self._encode_span_id(parent.span_id)
 
-        tags = self._extract_tags_from_span(span)
-        if tags:
-            encoded_span.update(tags)
+        kind = self._KIND_STR.get(span.kind)
+        if kind is not None:
+            encoded_span["kind"] = kind
 
-        annotations = self._extract_annotations_from_events(span.events)
-        if annotations:
-            encoded_span["annotations"] = annotations
+        if span.end_time:
+            encoded_span["end_time"] = (span.end_time + 500) // _NSEC_PER_MSEC
+            encoded_span["duration"] = (
+                span.end_time - span.start_time + 500
+            ) // _NSEC_PER_MSEC
+
+        if span.events:
+            encoded_span["annotations"] = self._extract_annotations_from_events(
+                span.events
+            )
 
         # debug = self._encode_debug(context)
         # if debug:
         #     encoded_span["debug"] = debug
 
-        parent_id = self._get_parent_id(span.parent)
-        if parent_id is not None:
-            encoded_span["parent_id"] = self._encode_span_id(parent_id)
-
-        attributes = self._extract_tags_from_dict(span.attributes)
-        if attributes:
-            encoded_span.update(attributes)
-
         return encoded_span
@@ -0,0 +1,85 @@
+# Copyright The OpenTelemetry Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import unittest
+from unittest import mock
+
+from opentelemetry.exporter.kafka.json.v1 import JsonV1Encoder
+from opentelemetry.exporter.kafka.node_endpoint import NodeEndpoint
+from opentelemetry.sdk.trace import TracerProvider
+
+
+class TestJsonV1Encoder(unittest.TestCase):
+    def setUp(self):
+        # NodeEndpoint requires a service.namespace resource attribute
+        env_patcher = mock.patch.dict(
+            os.environ, {"OTEL_RESOURCE_ATTRIBUTES": "service.namespace=tests"}
+        )
+        env_patcher.start()
+        self.addCleanup(env_patcher.stop)
+        self.encoder = JsonV1Encoder()
+        self.local_endpoint = NodeEndpoint("10.0.0.1")
+        tracer = TracerProvider().get_tracer(__name__)
+        self.spans = []
+        for name in ("first", "second"):
+            span = tracer.start_span(name, attributes={"key": name})
+            span.end()
+            self.spans.append(span)
+
+    def test_encode_batch_is_ndjson(self):
+        payload = self.encoder.encode_batch(self.spans, self.local_endpoint)
+        lines = payload.split(b"\n")
+        self.assertEqual(
+            lines,
+            [
+                self.encoder.serialize(span, self.local_endpoint)
+                for span in self.spans
+            ],
+        )
+        records = [json.loads(line) for line in lines]
+        self.assertEqual(
+            [record["data"]["name"] for record in records],
+            ["first", "second"],
+        )
+        self.assertEqual(records[1]["data"]["key"], "second")
+
+    def test_encode_batch_empty(self):
+        self.assertEqual(
+            self.encoder.encode_batch([], self.local_endpoint), b""
+        )
+
+    def test_timestamps_are_milliseconds(self):
+        tracer = TracerProvider().get_tracer(__name__)
+        span = tracer.start_span("span", start_time=1_500_000_000)
+        span.add_event("event", timestamp=2_500_000_000)
+        span.end(end_time=4_000_000_000)
+        record = json.loads(
+            self.encoder.serialize(span, self.local_endpoint)
+        )["data"]
+        self.assertEqual(record["start_time"], 1500)
+        self.assertEqual(record["end_time"], 4000)
+        self.assertEqual(record["duration"], 2500)
+        self.assertEqual(record["annotations"][0]["timestamp"], 2500)
+
+    def test_enduser_falls_back_when_user_is_unknown(self):
+        with mock.patch("getpass.getuser", side_effect=KeyError("uid")):
+            encoder = JsonV1Encoder()
+        record = json.loads(
+            encoder.serialize(self.spans[0], self.local_endpoint)
+        )["data"]
+        self.assertEqual(
+            record["enduser.id"], os.environ.get("USER", "unknown")
+        )
@@ -0,0 +1,157 @@
+# Copyright The OpenTelemetry Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import socket
+import unittest
+from unittest import mock
+
+from confluent_kafka import KafkaException
+
+from opentelemetry.exporter.kafka import json as kafka_json
+from opentelemetry.exporter.kafka.json import (
+    DEFAULT_MESSAGE_MAX_BYTES,
+    DEFAULT_TIMEOUT,
+    KafkaExporter,
+)
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SpanExportResult
+
+
+def _finished_spans(count, attributes=None):
+    tracer = TracerProvider().get_tracer(__name__)
+    spans = []
+    for _ in range(count):
+        span = tracer.start_span("span", attributes=attributes)
+        span.end()
+        spans.append(span)
+    return spans
+
+
+class TestKafkaExporter(unittest.TestCase):
+    def setUp(self):
+        # NodeEndpoint requires a service.namespace resource attribute
+        env_patcher = mock.patch.dict(
+            os.environ, {"OTEL_RESOURCE_ATTRIBUTES": "service.namespace=tests"}
+        )
+        env_patcher.start()
+        self.addCleanup(env_patcher.stop)
+        patcher = mock.patch("opentelemetry.exporter.kafka.json.Producer")
+        self.producer_class = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.producer = self.producer_class.return_value
+        self.producer.flush.return_value = 0
+        self.max_message_bytes = DEFAULT_MESSAGE_MAX_BYTES
+        self.producer.produce.side_effect = self._produce
+
+    def _produce(self, topic, key=None, value=None, on_delivery=None):
+        # librdkafka rejects oversized messages locally, before compression
+        if len(key) + len(value) > self.max_message_bytes:
+            raise KafkaException("MSG_SIZE_TOO_LARGE")
+
+    def _produced(self):
+        return [
+            produce_call.kwargs
+            for produce_call in self.producer.produce.call_args_list
+        ]
+
+    def _exporter(self, **kwargs):
+        return KafkaExporter(
+            kafkatopic="traces",
+            kafkanodes=["localhost:9092"],
+            local_node_ipv4="10.0.0.1",
+            **kwargs
+        )
+
+    def test_flush_uses_default_timeout(self):
+        exporter = self._exporter()
+        self.assertEqual(
+            exporter.export(_finished_spans(1)), SpanExportResult.SUCCESS
+        )
+        self.producer.flush.assert_called_once_with(DEFAULT_TIMEOUT)
+
+        exporter.shutdown()
+        self.producer.flush.assert_called_with(DEFAULT_TIMEOUT)
+
+    def test_producer_config_overrides_defaults(self):
+        self._exporter(producer_config={"linger.ms": 1000, "acks": "all"})
+        config = self.producer_class.call_args[0][0]
+        self.assertEqual(config["bootstrap.servers"], "localhost:9092")
+        self.assertEqual(config["linger.ms"], 1000)
+        self.assertEqual(config["acks"], "all")
+        self.assertNotIn("queue.buffering.max.ms", config)
+
+    def test_export_batch_as_single_message(self):
+        spans = _finished_spans(3)
+        self.assertEqual(
+            self._exporter().export(spans), SpanExportResult.SUCCESS
+        )
+        (message,) = self._produced()
+        self.assertEqual(len(message["value"].split(b"\n")), 3)
+        self.assertEqual(
+            message["key"],
+            spans[0].get_span_context().trace_id.to_bytes(16, "big"),
+        )
+
+    def test_export_splits_oversized_batch(self):
+        attributes = {"attr.{}".format(i): "x" * 100 for i in range(12)}
+        spans = _finished_spans(512, attributes)
+        self.assertEqual(
+            self._exporter().export(spans), SpanExportResult.SUCCESS
+        )
+        messages = self._produced()
+        self.assertGreater(len(messages), 1)
+        lines = []
+        for message in messages:
+            self.assertLessEqual(
+                len(message["key"]) + len(message["value"]),
+                DEFAULT_MESSAGE_MAX_BYTES,
+            )
+            first = len(lines)
+            lines.extend(message["value"].split(b"\n"))
+            self.assertEqual(
+                message["key"],
+                spans[first].get_span_context().trace_id.to_bytes(16, "big"),
+            )
+        self.assertEqual(len(lines), 512)
+        self.producer.flush.assert_called_once_with(DEFAULT_TIMEOUT)
+
+    def test_export_honors_message_max_bytes(self):
+        self.max_message_bytes = 20000
+        exporter = self._exporter(
+            producer_config={"message.max.bytes": self.max_message_bytes}
+        )
+        self.assertEqual(
+            exporter.export(_finished_spans(100)), SpanExportResult.SUCCESS
+        )
+        self.assertGreater(len(self._produced()), 1)
+
+    def test_export_continues_after_oversized_span(self):
+        self.max_message_bytes = 20000
+        exporter = self._exporter(
+            producer_config={"message.max.bytes": self.max_message_bytes}
+        )
+        spans = _finished_spans(1, {"big": "x" * 30000}) + _finished_spans(2)
+        with self.assertLogs(level="ERROR"):
+            self.assertEqual(exporter.export(spans), SpanExportResult.FAILURE)
+        self.assertEqual(len(self._produced()), 2)
+
+    @mock.patch.object(kafka_json, "_LOCAL_IPV4", None)
+    @mock.patch("socket.gethostbyname")
+    def test_local_ipv4_lookup_retried_after_failure(self, gethostbyname):
+        gethostbyname.side_effect = [socket.gaierror(), "10.0.0.2"]
+        self.assertIsNone(kafka_json._local_ipv4())
+        self.assertEqual(kafka_json._local_ipv4(), "10.0.0.2")
+        self.assertEqual(kafka_json._local_ipv4(), "10.0.0.2")
+        self.assertEqual(gethostbyname.call_count, 2)
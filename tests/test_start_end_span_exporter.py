@@ -0,0 +1,150 @@
+# Copyright The OpenTelemetry Authors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+from opentelemetry.exporter.kafka.json import StartEndSpanExporter
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+
+class TestStartEndSpanExporter(unittest.TestCase):
+    def setUp(self):
+        self.batches = []
+        self.exported = threading.Condition()
+        self.exporter = mock.Mock(spec=SpanExporter)
+        self.exporter.export.side_effect = self._export
+
+    def _export(self, spans):
+        with self.exported:
+            self.batches.append(list(spans))
+            self.exported.notify_all()
+        return SpanExportResult.SUCCESS
+
+    def _wait_for_batches(self, count):
+        with self.exported:
+            return self.exported.wait_for(
+                lambda: len(self.batches) >= count, timeout=5
+            )
+
+    def _processor(self, **kwargs):
+        processor = StartEndSpanExporter(self.exporter, **kwargs)
+        self.addCleanup(processor.shutdown)
+        provider = TracerProvider()
+        provider.add_span_processor(processor)
+        return processor, provider.get_tracer(__name__)
+
+    def test_exports_start_and_end(self):
+        processor, tracer = self._processor()
+        with tracer.start_as_current_span("span"):
+            pass
+        self.assertTrue(processor.force_flush())
+        spans = [span for batch in self.batches for span in batch]
+        self.assertEqual([span.name for span in spans], ["span", "span"])
+        self.assertIsNone(spans[0].end_time)
+        self.assertIsNotNone(spans[1].end_time)
+
+    def test_start_record_is_a_snapshot(self):
+        processor, tracer = self._processor()
+        with tracer.start_as_current_span("span", attributes={"a": 1}) as span:
+            span.set_attribute("b", 2)
+            span.add_event("event")
+        self.assertTrue(processor.force_flush())
+        start, end = [span for batch in self.batches for span in batch]
+        self.assertEqual(dict(start.attributes), {"a": 1})
+        self.assertEqual(start.events, ())
+        self.assertEqual(dict(end.attributes), {"a": 1, "b": 2})
+        self.assertEqual(len(end.events), 1)
+
+    def test_waits_for_schedule_delay_to_batch(self):
+        _, tracer = self._processor(schedule_delay_millis=200)
+        for _ in range(3):
+            tracer.start_span("span").end()
+        self.assertTrue(self._wait_for_batches(1))
+        self.assertEqual([len(batch) for batch in self.batches], [6])
+
+    def test_exports_full_batch_without_waiting(self):
+        processor, tracer = self._processor(
+            max_export_batch_size=4, schedule_delay_millis=60000
+        )
+        for _ in range(4):
+            tracer.start_span("span").end()
+        self.assertTrue(self._wait_for_batches(2))
+        self.assertEqual([len(batch) for batch in self.batches], [4, 4])
+
+    def test_drops_spans_when_queue_is_full(self):
+        release = threading.Event()
+        exporting = threading.Event()
+
+        def blocking_export(spans):
+            exporting.set()
+            release.wait()
+            return self._export(spans)
+
+        self.exporter.export.side_effect = blocking_export
+        processor = StartEndSpanExporter(
+            self.exporter, max_queue_size=1, max_export_batch_size=1
+        )
+        self.addCleanup(processor.shutdown)
+        self.addCleanup(release.set)
+        span = TracerProvider().get_tracer(__name__).start_span("span")
+        span.end()
+
+        processor.on_end(span)
+        self.assertTrue(exporting.wait(5))
+        processor.on_end(span)
+        with self.assertLogs(level="WARNING"):
+            for _ in range(3):
+                processor.on_end(span)
+        self.assertEqual(processor._dropped_spans, 3)
+
+        release.set()
+        self.assertTrue(processor.force_flush())
+        self.assertEqual(sum(len(batch) for batch in self.batches), 2)
+
+    def test_shutdown_drains_queue(self):
+        processor, tracer = self._processor(schedule_delay_millis=60000)
+        for _ in range(3):
+            tracer.start_span("span").end()
+        processor.shutdown()
+        self.assertEqual(sum(len(batch) for batch in self.batches), 6)
+        self.exporter.shutdown.assert_called_once_with()
+
+    def test_force_flush_after_shutdown(self):
+        processor, _ = self._processor()
+        processor.shutdown()
+        start = time.monotonic()
+        self.assertTrue(processor.force_flush(timeout_millis=5000))
+        self.assertLess(time.monotonic() - start, 1)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "needs os.fork")
+    def test_exports_after_fork(self):
+        processor, tracer = self._processor()
+        pid = os.fork()
+        if pid == 0:
+            # Child: the worker thread must have been restarted
+            exit_code = 1
+            try:
+                tracer.start_span("span").end()
+                if processor.force_flush(timeout_millis=5000) and self.batches:
+                    exit_code = 0
+            finally:
+                os._exit(exit_code)  # pylint: disable=protected-access
+        _, status = os.waitpid(pid, 0)
+        self.assertTrue(os.WIFEXITED(status))
+        self.assertEqual(os.WEXITSTATUS(status), 0)